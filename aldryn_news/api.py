@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.translation import get_language
+from django.views.generic import View
+
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from easy_thumbnails.files import get_thumbnailer
+
+from aldryn_news.models import News, TaggedItem, has_cached_translation, resolve_news_urls
+from aldryn_news.pagination import decode_cursor, encode_cursor, filter_after
+from aldryn_news.utils import get_language_codes
+
+API_LIMIT = getattr(settings, 'ALDRYN_NEWS_API_LIMIT', 100)
+API_MAX_LIMIT = getattr(settings, 'ALDRYN_NEWS_API_MAX_LIMIT', 10000)
+
+
+def get_news_tags(news_ids, language):
+    """Returns a dict of news id -> list of tags ({'name', 'slug'}) in `language`."""
+    tagged_items = (TaggedItem.objects
+                              .filter(content_type=ContentType.objects.get_for_model(News),
+                                      object_id__in=news_ids,
+                                      tag__translations__language_code=language)
+                              .values_list('object_id', 'tag__translations__name', 'tag__translations__slug'))
+    tags = {}
+    for news_id, name, slug in tagged_items:
+        tags.setdefault(news_id, []).append({'name': name, 'slug': slug})
+    return tags
+
+
+def get_thumbnail_url(image, size=News.THUMBNAIL_SIZE):
+    if not image:
+        return None
+    width, height = [int(value) for value in size.split('x')]
+    try:
+        return get_thumbnailer(image).get_thumbnail({'size': (width, height), 'crop': True}).url
+    except (IOError, InvalidImageFormatError):
+        return None
+
+
+class NewsJSONView(View):
+    """
+    Streams the published news of a language as JSON, newest first:
+    ``{"results": [...], "next": <cursor or null>}``. Pass the `next` cursor
+    as ``?after=`` to continue. Only `batch_size` news are held in memory
+    at a time, whatever the `limit`.
+    """
+    batch_size = 100
+
+    def get(self, request, *args, **kwargs):
+        language = request.GET.get('language') or get_language()
+        if language not in get_language_codes():
+            raise Http404
+        cursor = request.GET.get('after') or None
+        try:
+            limit = min(int(request.GET.get('limit', API_LIMIT)), API_MAX_LIMIT)
+            if cursor:
+                decode_cursor(cursor)
+        except ValueError:
+            # has to fail before the response starts streaming
+            return HttpResponseBadRequest('Invalid limit or cursor.')
+
+        queryset = News.published.language(language).with_category('key_visual')
+        return StreamingHttpResponse(self.stream(queryset, language, cursor, max(limit, 0)),
+                                     content_type='application/json')
+
+    def stream(self, queryset, language, cursor, limit):
+        yield '{"results": ['
+        sent = 0
+        while sent < limit:
+            batch = list(filter_after(queryset, cursor)[:min(self.batch_size, limit - sent)])
+            if not batch:
+                cursor = None
+                break
+            resolve_news_urls(batch, language)
+            tags = get_news_tags([news.pk for news in batch], language)
+            for news in batch:
+                yield (',' if sent else '') + json.dumps(self.serialize(news, language, tags.get(news.pk, [])))
+                sent += 1
+            cursor = encode_cursor(batch[-1])
+        if cursor and not filter_after(queryset, cursor).exists():
+            cursor = None
+        yield '], "next": %s}' % json.dumps(cursor)
+
+    def serialize(self, news, language, tags):
+        category = None
+        if news.category_id and has_cached_translation(news.category, language):
+            category = {'name': news.category.name, 'slug': news.category.slug}
+        return {
+            'id': news.pk,
+            'title': news.title,
+            'lead_in': news.lead_in,
+            'url': self.request.build_absolute_uri(news.get_absolute_url(language)),
+            'publication_start': news.publication_start.isoformat(),
+            'category': category,
+            'tags': tags,
+            'key_visual': get_thumbnail_url(news.key_visual),
+        }
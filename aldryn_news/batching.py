@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Loads the news of all news plugins in a placeholder together.
+
+The first LatestNewsPlugin (or NewsLinksPlugin) rendered in a placeholder
+loads the news of the other plugins of that kind in it (nested ones included,
+skipping those a render cache already covers) as well: the tags and the links
+of all plugins in one query each, the news of LatestNewsPlugins with the
+same tags once (sliced per plugin), all linked news in a single query and
+the urls of everything in bulk. The batch lives on the request, so the
+remaining plugins of the placeholder render without queries.
+
+A latest news query per distinct tag selection remains, a top-N per plugin
+can't be had in one query without window functions.
+"""
+from collections import defaultdict
+
+from aldryn_news.models import LatestNewsPlugin, News, NewsLink, NewsLinksPlugin, resolve_news_urls
+
+REQUEST_ATTRIBUTE = '_aldryn_news_batches'
+
+
+def get_plugin_news(context, instance, placeholder, wanted=None):
+    """
+    Returns the news of a LatestNewsPlugin or NewsLinksPlugin as a list,
+    loaded in one batch with the news plugins next to it. `wanted` can
+    narrow down a list of plugins to those needing their news, e.g. the
+    ones missing from a render cache.
+    """
+    request = context.get('request')
+    if request is None or placeholder is None or not placeholder.pk:
+        return list(instance.get_news())
+    batches = getattr(request, REQUEST_ATTRIBUTE, None)
+    if batches is None:
+        batches = {}
+        setattr(request, REQUEST_ATTRIBUTE, batches)
+    key = (placeholder.pk, instance.language)
+    if key not in batches:
+        batches[key] = PlaceholderBatch(placeholder, instance.language)
+    return batches[key].get_news(instance, wanted)
+
+
+def walk_plugins(plugins):
+    """Yields the plugins and their descendants, the cms nests them in child_plugin_instances."""
+    for plugin in plugins:
+        yield plugin
+        for child in walk_plugins(getattr(plugin, 'child_plugin_instances', None) or []):
+            yield child
+
+
+class PlaceholderBatch(object):
+
+    def __init__(self, placeholder, language):
+        self.placeholder = placeholder
+        self.language = language
+        self._news = {}  # plugin pk -> list of news
+        self._loaded = set()
+
+    def get_news(self, instance, wanted=None):
+        # each kind is loaded on first use, cached plugins may not need theirs
+        model = LatestNewsPlugin if isinstance(instance, LatestNewsPlugin) else NewsLinksPlugin
+        if model not in self._loaded:
+            self._loaded.add(model)
+            self.load(model, wanted)
+        if instance.pk not in self._news:
+            # not in the placeholder or not wanted when the batch was loaded
+            self._news[instance.pk] = list(instance.get_news())
+        return self._news[instance.pk]
+
+    def get_plugins(self, model):
+        # the cms keeps the downcasted root plugins of a rendered placeholder around
+        plugins = getattr(self.placeholder, '_plugins_cache', None)
+        if plugins is None:
+            return list(model.objects.filter(placeholder=self.placeholder, language=self.language))
+        return [plugin for plugin in walk_plugins(plugins)
+                if isinstance(plugin, model) and plugin.language == self.language]
+
+    def load(self, model, wanted=None):
+        plugins = self.get_plugins(model)
+        if wanted:
+            plugins = wanted(plugins)
+        if model is LatestNewsPlugin:
+            news = self.load_latest_news(plugins)
+        else:
+            news = self.load_news_links(plugins)
+        # news come with their category translation, so this seldom needs a query
+        resolve_news_urls([item for items in news.values() for item in items])
+        self._news.update(news)
+
+    def load_latest_news(self, plugins):
+        if not plugins:
+            return {}
+        tags = defaultdict(set)
+        tagged = (LatestNewsPlugin.tags.through.objects
+                  .filter(latestnewsplugin__in=[plugin.pk for plugin in plugins])
+                  .values_list('latestnewsplugin', 'tag'))
+        for plugin_id, tag_id in tagged:
+            tags[plugin_id].add(tag_id)
+
+        # plugins with the same tags share a query, sliced to the longest list
+        limits = {}
+        for plugin in plugins:
+            signature = frozenset(tags[plugin.pk])
+            limits[signature] = max(limits.get(signature, 0), plugin.latest_entries)
+        results = {}
+        for signature, limit in limits.items():
+            results[signature] = list(LatestNewsPlugin.get_news_queryset(self.language, signature)[:limit])
+        return dict((plugin.pk, results[frozenset(tags[plugin.pk])][:plugin.latest_entries])
+                    for plugin in plugins)
+
+    def load_news_links(self, plugins):
+        if not plugins:
+            return {}
+        links = defaultdict(list)
+        linked = (NewsLink.objects
+                  .filter(newslinksplugin__in=[plugin.pk for plugin in plugins])
+                  .values_list('newslinksplugin', 'news'))
+        for plugin_id, news_id in linked:  # in the order chosen by the editor
+            links[plugin_id].append(news_id)
+
+        news_ids = set(news_id for news_ids in links.values() for news_id in news_ids)
+        news = {}
+        if news_ids:
+            news = News.objects.language(self.language).with_category('key_visual').filter(pk__in=news_ids)
+            news = dict((item.pk, item) for item in news)
+        return dict((plugin.pk, [news[news_id] for news_id in links[plugin.pk] if news_id in news])
+                    for plugin in plugins)
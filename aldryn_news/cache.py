@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Cache helpers aware of the publication window of the news.
+
+Anything built on News.published depends on timezone.now() and would
+normally be impossible to cache. The timeline below knows the next moment
+a news item enters or leaves the published window; cached values are keyed
+by the timeline version and expire at that boundary at the latest. The
+version is bumped whenever news change or a boundary has been passed.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.core.urlresolvers import reverse
+from django.db.models import Min, Q
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.translation import get_language, override
+
+from aldryn_news.models import News, PublicationCheckpoint
+from aldryn_news.utils import get_weight_tier
+
+CACHE_TIMEOUT = getattr(settings, 'ALDRYN_NEWS_CACHE_TIMEOUT', 60 * 60)
+TAG_CLOUD_SIZE = getattr(settings, 'ALDRYN_NEWS_TAG_CLOUD_SIZE', None)
+TAG_CLOUD_TIERS = getattr(settings, 'ALDRYN_NEWS_TAG_CLOUD_TIERS', 5)
+TIMELINE_CACHE_KEY = 'aldryn_news_timeline'
+PAGES_CACHE_KEY = 'aldryn_news_pages_version'
+# the timeline must outlive everything keyed by its version
+TIMELINE_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# changes waiting for the end of the request, per thread
+_pending = threading.local()
+
+# sent when news entered or left the published window between `since` and `until`
+publication_boundary_passed = Signal(providing_args=['since', 'until'])
+
+
+def get_next_publication_boundary(now=None):
+    """Returns the next publication_start or publication_end after `now`, or None."""
+    now = now or timezone.now()
+    news = News.objects.get_query_set()
+    boundaries = [
+        news.filter(publication_start__gt=now).aggregate(boundary=Min('publication_start'))['boundary'],
+        news.filter(publication_end__gt=now).aggregate(boundary=Min('publication_end'))['boundary'],
+    ]
+    boundaries = [boundary for boundary in boundaries if boundary]
+    return min(boundaries) if boundaries else None
+
+
+def _reset_timeline(previous=None, now=None):
+    now = now or timezone.now()
+    version = int(time.time() * 1000)
+    if previous:
+        version = max(version, previous['version'] + 1)
+    timeline = {
+        'version': version,
+        'boundary': get_next_publication_boundary(now),
+        'computed': now,  # boundaries up to this moment are accounted for
+        'changed': now,  # last time the published news changed
+    }
+    cache.set(TIMELINE_CACHE_KEY, timeline, TIMELINE_CACHE_TIMEOUT)
+    return timeline
+
+
+def get_checkpoint():
+    """Returns the moment up to which passed boundaries were handled, or None."""
+    checkpoint = PublicationCheckpoint.objects.filter(pk=1).values_list('processed_until', flat=True)
+    return checkpoint[0] if checkpoint else None
+
+
+def set_checkpoint(until):
+    if not PublicationCheckpoint.objects.filter(pk=1).update(processed_until=until):
+        PublicationCheckpoint.objects.get_or_create(pk=1, defaults={'processed_until': until})
+
+
+def get_crossed_news(since, until):
+    """News that entered or left the published window between `since` and `until`."""
+    return News.objects.get_query_set().filter(Q(publication_start__gt=since, publication_start__lte=until) |
+                                               Q(publication_end__gte=since, publication_end__lt=until))
+
+
+def _pass_boundaries(since, until):
+    publication_boundary_passed.send(sender=News, since=since, until=until)
+    set_checkpoint(until)
+
+
+def get_timeline():
+    """
+    Returns the timeline, a dict with the current `version`, the next
+    `boundary` and the moment the published news last `changed`.
+    """
+    timeline = cache.get(TIMELINE_CACHE_KEY)
+    now = timezone.now()
+    if timeline is None:
+        # the cache lost the timeline, catch up from the checkpoint in the database
+        since = get_checkpoint()
+        if since is None:
+            set_checkpoint(now)
+        elif get_crossed_news(since, now).exists():
+            _pass_boundaries(since, now)
+        return _reset_timeline(now=now)
+    if timeline['boundary'] and timeline['boundary'] <= now:
+        _pass_boundaries(timeline['computed'], now)
+        return _reset_timeline(timeline, now)
+    return timeline
+
+
+def invalidate():
+    """Call when news changed, makes all the cached values stale."""
+    # boundaries passed since the last check are handled before the timeline restarts from now
+    _reset_timeline(get_timeline())
+    # changes made within a request may not be committed yet, requests reading the
+    # old rows meanwhile cache them under the new version: bump it again afterwards
+    _pending.invalidate = True
+
+
+def get_pages_version():
+    """Version of the cached pages, on top of the timeline version."""
+    version = cache.get(PAGES_CACHE_KEY)
+    if version is None:
+        version = _reset_pages_version()
+    return version
+
+
+def _reset_pages_version(previous=None):
+    version = max(int(time.time() * 1000), (previous or 0) + 1)
+    cache.set(PAGES_CACHE_KEY, version, TIMELINE_CACHE_TIMEOUT)
+    return version
+
+
+def invalidate_pages():
+    """
+    Call when something shown around the news changed, e.g. plugins on
+    other placeholders. Makes the cached pages stale, but not the news data.
+    """
+    _reset_pages_version(cache.get(PAGES_CACHE_KEY))
+    _pending.invalidate_pages = True
+
+
+def invalidate_pending(sender, **kwargs):
+    """Bumps the versions once more after a request that changed them, see invalidate()."""
+    if getattr(_pending, 'invalidate', False):
+        _pending.invalidate = False
+        _reset_timeline(get_timeline())
+    if getattr(_pending, 'invalidate_pages', False):
+        _pending.invalidate_pages = False
+        _reset_pages_version(cache.get(PAGES_CACHE_KEY))
+
+request_finished.connect(invalidate_pending)
+
+
+def get_version():
+    return get_timeline()['version']
+
+
+def get_timeout(timeout=CACHE_TIMEOUT):
+    """Returns `timeout`, shortened so it expires at the next publication boundary."""
+    timeline = get_timeline()
+    if timeline['boundary']:
+        remaining = (timeline['boundary'] - timezone.now()).total_seconds()
+        timeout = min(timeout, max(1, int(math.ceil(remaining))))
+    return timeout
+
+
+def make_key(*bits):
+    """Returns a cache key for the given bits, valid for the current version only."""
+    digest = hashlib.md5(u':'.join(map(force_text, bits)).encode('utf-8')).hexdigest()
+    return 'aldryn_news:%s:%s' % (get_version(), digest)
+
+
+def get_months(language):
+    """Cached News.published.get_months, the archive hierarchy of a language."""
+    key = make_key('months', language)
+    months = cache.get(key)
+    if months is None:
+        months = News.published.get_months(language)
+        cache.set(key, months, get_timeout())
+    return months
+
+
+def get_archive_tree(language):
+    """
+    Returns the archive of a language grouped by year, newest first: dicts
+    with `year`, `count`, `url` and `months`, dicts with `date`, `count` and
+    `url`. Built from the counters table and cached until the news change.
+    """
+    key = make_key('archive_tree', language)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_archive_tree(language)
+        cache.set(key, tree, get_timeout())
+    return tree
+
+
+def build_archive_tree(language):
+    tree = []
+    with override(language):
+        for month in get_months(language):
+            date = month['date']
+            if not tree or tree[-1]['year'] != date.year:
+                tree.append({
+                    'year': date.year,
+                    'count': 0,
+                    'url': reverse('aldryn_news:archive-year', kwargs={'year': date.year}),
+                    'months': [],
+                })
+            tree[-1]['count'] += month['count']
+            tree[-1]['months'].append({
+                'date': date,
+                'count': month['count'],
+                'url': reverse('aldryn_news:archive-month', kwargs={'year': date.year, 'month': date.month}),
+            })
+    return tree
+
+
+def get_tag_cloud(language):
+    """
+    Returns the most used tags of a language as dicts with `name`, `slug`,
+    `count`, `url` and the weight `tier` (1 to ALDRYN_NEWS_TAG_CLOUD_TIERS),
+    ordered by count. Built from the counters table, which follows tagging
+    changes, and cached until the news change.
+    """
+    key = make_key('tag_cloud', language)
+    cloud = cache.get(key)
+    if cloud is None:
+        cloud = build_tag_cloud(language)
+        cache.set(key, cloud, get_timeout())
+    return cloud
+
+
+def build_tag_cloud(language):
+    tags = News.published.get_tags(language, limit=TAG_CLOUD_SIZE)
+    if not tags:
+        return []
+    counts = [tag.count for tag in tags]
+    min_count, max_count = min(counts), max(counts)
+    cloud = []
+    with override(language):
+        for tag in tags:
+            cloud.append({
+                'name': tag.name,
+                'slug': tag.slug,
+                'count': tag.count,
+                'url': reverse('aldryn_news:tagged-news', kwargs={'tag': tag.slug}),
+                'tier': get_weight_tier(tag.count, min_count, max_count, TAG_CLOUD_TIERS),
+            })
+    return cloud
+
+
+# for django.views.decorators.http.condition, on views listing published news
+
+def get_list_etag(request, *args, **kwargs):
+    return make_key('etag', get_pages_version(), get_language(), request.get_full_path())
+
+
+def get_list_last_modified(request, *args, **kwargs):
+    # the pages version is a timestamp in milliseconds, like timezone.now() aware or not
+    pages_changed = datetime.datetime.fromtimestamp(get_pages_version() / 1000.0,
+                                                    timezone.utc if settings.USE_TZ else None)
+    return max(get_timeline()['changed'], pages_changed)
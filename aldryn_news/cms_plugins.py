@@ -1,17 +1,36 @@
 # -*- coding: utf-8 -*-
+from django.contrib import admin
+from django.core.cache import cache as cache_backend
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
 from cms.plugin_base import CMSPluginBase
 from cms.plugin_pool import plugin_pool
 
-from aldryn_news import models
+from aldryn_news import cache, models
+from aldryn_news.batching import get_plugin_news
 from aldryn_news.forms import MultipleTagForm, LinksForm
 
 
+class NewsLinkInline(admin.TabularInline):
+
+    model = models.NewsLink
+    form = LinksForm
+    extra = 1
+
+
 class NewsPluginBase(CMSPluginBase):
 
     module = 'News'
 
+    def is_cacheable(self, context):
+        # editors get the render_model markup of the toolbar, which must not be cached
+        request = context.get('request')
+        if request is None or request.user.is_staff:
+            return False
+        return not getattr(getattr(request, 'toolbar', None), 'edit_mode', False)
+
 
 @plugin_pool.register_plugin
 class LatestNewsPlugin(NewsPluginBase):
@@ -20,13 +39,38 @@ class LatestNewsPlugin(NewsPluginBase):
     name = _('Latest News Entries')
     model = models.LatestNewsPlugin
     form = MultipleTagForm
+    news_template = 'aldryn_news/includes/news_items.html'
 
     def render(self, context, instance, placeholder):
         context['FULL'] = models.LatestNewsPlugin.FULL
         context['SIMPLE'] = models.LatestNewsPlugin.SIMPLE
         context['instance'] = instance
+        context['news_html'] = None
+        if not self.is_cacheable(context):
+            context['news_items'] = get_plugin_news(context, instance, placeholder)
+            return context
+        key = self.get_cache_key(instance)
+        news_html = cache_backend.get(key)
+        if news_html is None:
+            news_html = render_to_string(self.news_template, {
+                'news': get_plugin_news(context, instance, placeholder, wanted=self.get_uncached),
+                'type': instance.type_list,
+            }, context_instance=context)
+            cache_backend.set(key, news_html, cache.get_timeout())
+        context['news_html'] = mark_safe(news_html)
         return context
 
+    def get_cache_key(self, instance):
+        # keyed by the cache timeline version, so it goes stale on news, tag and
+        # plugin changes and expires at the next publication boundary
+        return cache.make_key('latest_news', instance.pk, instance.language, instance.type_list)
+
+    def get_uncached(self, plugins):
+        """The plugins whose news list isn't cached, only those need their news loaded."""
+        keys = dict((self.get_cache_key(plugin), plugin) for plugin in plugins)
+        cached = cache_backend.get_many(list(keys))
+        return [plugin for key, plugin in keys.items() if key not in cached]
+
 
 @plugin_pool.register_plugin
 class TagsPlugin(NewsPluginBase):
@@ -36,7 +80,7 @@ class TagsPlugin(NewsPluginBase):
     form = MultipleTagForm
 
     def render(self, context, instance, placeholder):
-        context['tags'] = models.News.published.get_tags(language=instance.language)
+        context['tags'] = cache.get_tag_cloud(instance.language)
         return context
 
 
@@ -48,7 +92,7 @@ class CategoriesPlugin(NewsPluginBase):
 
     def render(self, context, instance, placeholder):
         get_categories = models.Category.objects.get_with_usage_count
-        context['categories'] = get_categories(language=instance.language, news__isnull=False)
+        context['categories'] = get_categories(language=instance.language, published=True)
         return context
 
 
@@ -59,7 +103,9 @@ class ArchivePlugin(NewsPluginBase):
     name = _('Archive')
 
     def render(self, context, instance, placeholder):
-        context['dates'] = models.News.published.get_months(language=instance.language)
+        context['archive'] = cache.get_archive_tree(instance.language)
+        # flat list of months, for templates made before the archive tree
+        context['dates'] = cache.get_months(instance.language)
         return context
 
 
@@ -69,9 +115,9 @@ class NewsLinksPlugin(NewsPluginBase):
     render_template = 'aldryn_news/plugins/news_links.html'
     name = _("News links")
     model = models.NewsLinksPlugin
-    form = LinksForm
-    filter_horizontal = ['news']
+    inlines = [NewsLinkInline]
 
     def render(self, context, instance, placeholder):
         context['instance'] = instance
+        context['news_items'] = get_plugin_news(context, instance, placeholder)
         return context
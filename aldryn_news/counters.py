@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from aldryn_news.models import Category, News, NewsCounter, TaggedItem
+from aldryn_news.utils import get_date_range, get_language_codes, get_month_key
+
+atomic = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+
+
+def get_counter_keys(news_id, category_id=None, publication_start=None):
+    """Returns the (kind, key) pairs the given news contributes to."""
+    keys = set()
+    if category_id:
+        keys.add((NewsCounter.CATEGORY, str(category_id)))
+    if publication_start:
+        keys.add((NewsCounter.MONTH, get_month_key(publication_start)))
+    if news_id:
+        tag_ids = (TaggedItem.objects
+                             .filter(content_type=ContentType.objects.get_for_model(News), object_id=news_id)
+                             .values_list('tag', flat=True))
+        keys.update((NewsCounter.TAG, str(tag_id)) for tag_id in tag_ids)
+    return keys
+
+
+def get_stored_counter_keys(news_id):
+    """Same as get_counter_keys, but for the news as currently stored in the database."""
+    stored = News.objects.filter(pk=news_id).values_list('category', 'publication_start')
+    if not stored:
+        return set()
+    category_id, publication_start = stored[0]
+    return get_counter_keys(news_id, category_id, publication_start)
+
+
+def count_news(kind, key, language):
+    news = News.published.filter_language(language)
+    if kind == NewsCounter.CATEGORY:
+        news = news.filter(category=key)
+    elif kind == NewsCounter.TAG:
+        news = news.filter(tagged_items__tag=key)
+    elif kind == NewsCounter.MONTH:
+        start, end = get_date_range(key[:4], key[5:7])
+        news = news.filter(publication_start__gte=start, publication_start__lt=end)
+    return news.count()
+
+
+def update_counters(keys, languages=None):
+    """Recounts the given (kind, key) pairs from the news table."""
+    for language in languages or get_language_codes():
+        for kind, key in keys:
+            NewsCounter.objects.set_count(kind, language, key, count_news(kind, key, language))
+
+
+def rebuild_counters(languages=None):
+    """Recreates all the counters of the given languages from scratch."""
+    languages = languages or get_language_codes()
+    counters = []
+    for language in languages:
+        tags = News.published.get_tag_counts(language, use_counters=False)
+        categories = Category.objects.get_usage_counts(language, published=True, use_counters=False)
+        months = dict((get_month_key(month['date']), month['count'])
+                      for month in News.published.get_months(language, use_counters=False))
+        for kind, counts in ((NewsCounter.TAG, tags), (NewsCounter.CATEGORY, categories), (NewsCounter.MONTH, months)):
+            counters.extend(NewsCounter(kind=kind, language_code=language, key=str(key), count=count)
+                            for key, count in counts.items())
+
+    with atomic():
+        NewsCounter.objects.filter(language_code__in=languages).delete()
+        NewsCounter.objects.bulk_create(counters)
+    return len(counters)
@@ -1,17 +1,43 @@
 # -*- coding: utf-8 -*-
 from django.contrib.sites.models import Site
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache as cache_backend
 from django.core.urlresolvers import reverse
-from django.utils.translation import ugettext as _
+from django.http import Http404, HttpResponse
+from django.utils.translation import get_language, ugettext as _
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
 
+from aldryn_news import cache
 from aldryn_news.models import News, Category
+from aldryn_news.utils import parse_tag_slugs
 
 LATEST_ENTRIES = 10
 
 
 class LatestEntriesFeed(Feed):
 
+    def __call__(self, request, *args, **kwargs):
+        view = condition(etag_func=cache.get_list_etag, last_modified_func=cache.get_list_last_modified)(self.get_cached_response)
+        return view(request, *args, **kwargs)
+
+    def get_cached_response(self, request, *args, **kwargs):
+        """
+        Returns the serialized feed, cached per feed, object and language
+        until news change or the next publication boundary.
+        """
+        key = cache.make_key('feed', self.__class__.__name__, get_language(), request.get_host(),
+                             args, sorted(kwargs.items()))
+        cached = cache_backend.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super(LatestEntriesFeed, self).__call__(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache_backend.set(key, (response.content, response['Content-Type']), cache.get_timeout())
+        return response
+
     def link(self):
         return reverse('latest-news', current_app='news')
 
@@ -19,7 +45,7 @@ class LatestEntriesFeed(Feed):
         return _('News on %(site_name)s') % {'site_name': Site.objects.get_current().name}
 
     def items(self, obj):
-        return News.published.language().order_by('-publication_start')[:LATEST_ENTRIES]
+        return News.published.language().order_by('-publication_start').with_urls()[:LATEST_ENTRIES]
 
     def item_title(self, item):
         return item.title
@@ -31,18 +57,20 @@ class LatestEntriesFeed(Feed):
 class TagFeed(LatestEntriesFeed):
 
     def get_object(self, request, tag):
-        return tag
+        try:
+            return parse_tag_slugs(tag)
+        except ValueError:
+            raise Http404
 
     def items(self, obj):
-        # can't filter by tags on TranslatedQuerySet
-        tagged_pks = list(News.published.filter(tags__slug=obj).values_list('pk', flat=True))
-        return News.published.language().filter(pk__in=tagged_pks)[:LATEST_ENTRIES]
+        slugs, match_all = obj
+        return News.published.language().tagged(slugs, match_all=match_all).with_urls()[:LATEST_ENTRIES]
 
 
 class CategoryFeed(LatestEntriesFeed):
 
-    def get_object(self, request, slug):
-        return get_object_or_404(Category.objects.language(), slug=slug)
+    def get_object(self, request, category_slug):
+        return get_object_or_404(Category.objects.language(), slug=category_slug)
 
     def items(self, obj):
-        return News.published.language().filter(category=obj)[:LATEST_ENTRIES]
+        return News.published.language().filter(category=obj).with_urls()[:LATEST_ENTRIES]
@@ -9,7 +9,7 @@ from hvad.forms import TranslatableModelForm
 import taggit
 from unidecode import unidecode
 
-from .models import Tag, News
+from .models import Tag, News, NewsLink
 
 
 class MultipleTagForm(forms.ModelForm):
@@ -124,4 +124,5 @@ class LinksForm(forms.ModelForm):
         self.fields['news'].queryset = News.objects.language()
 
     class Meta:
-        model = News
+        model = NewsLink
+        fields = ['news', 'position']
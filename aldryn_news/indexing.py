@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental search index updates. Changes to news, their translations and
+their content plugins queue the affected (news, language) pairs, see
+aldryn_news.signals; process_queue() updates or removes their documents
+in the search backend of each language.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.utils import timezone
+
+from aldryn_news.counters import atomic
+from aldryn_news.models import News, SearchQueueItem
+from aldryn_news.utils import get_language_codes
+
+SEARCH = getattr(settings, 'ALDRYN_NEWS_SEARCH', True) and 'aldryn_search' in settings.INSTALLED_APPS
+
+
+def queue_news(news_ids, languages=None):
+    """Queues the given news in `languages`, all languages by default."""
+    news_ids = set(news_ids)
+    languages = languages or get_language_codes()
+    if not SEARCH or not news_ids:
+        return
+    queued = SearchQueueItem.objects.filter(news_id__in=news_ids, language_code__in=languages)
+    existing = set(queued.values_list('news_id', 'language_code'))
+    # items being processed by a worker right now are processed once more
+    queued.update(queued_at=timezone.now())
+    missing = [SearchQueueItem(news_id=news_id, language_code=language)
+               for news_id in news_ids for language in languages
+               if (news_id, language) not in existing]
+    if not missing:
+        return
+    try:
+        with atomic():
+            SearchQueueItem.objects.bulk_create(missing)
+    except IntegrityError:
+        # queued concurrently, they are waiting already
+        pass
+
+
+def get_news_index(language):
+    """Returns the haystack connection alias, the news index and the backend of `language`."""
+    from haystack import connections
+    from aldryn_search.utils import alias_from_language
+
+    alias = alias_from_language(language)
+    index = connections[alias].get_unified_index().get_index(News)
+    index._backend_alias = alias  # aldryn_search indexes take their language from it
+    return alias, index, connections[alias].get_backend()
+
+
+def update_documents(language, news_ids):
+    """
+    Updates the documents of the given news in the search backend of
+    `language`, removing those of news no longer published in it.
+    """
+    alias, index, backend = get_news_index(language)
+    news = list(index.index_queryset(using=alias).filter(pk__in=news_ids))
+    if news:
+        backend.update(index, news)
+    gone = set(news_ids) - set(item.pk for item in news)
+    for news_id in gone:
+        backend.remove('%s.%s.%s' % (News._meta.app_label, News._meta.module_name, news_id))
+
+
+def process_queue(batch_size=100):
+    """Drains the queue in batches, returns the number of processed items."""
+    processed = 0
+    while True:
+        started = timezone.now()
+        items = list(SearchQueueItem.objects.order_by('queued_at', 'pk')[:batch_size])
+        if not items:
+            return processed
+        news_ids = defaultdict(set)
+        for item in items:
+            news_ids[item.language_code].add(item.news_id)
+        for language, ids in news_ids.items():
+            update_documents(language, ids)
+        # items queued again meanwhile stay for the next batch
+        SearchQueueItem.objects.filter(pk__in=[item.pk for item in items], queued_at__lte=started).delete()
+        processed += len(items)
+
+
+def get_pk_ranges(language, size):
+    """
+    Returns the inclusive (first pk, last pk) ranges holding the news indexed
+    in `language`. Ranges are aligned on multiples of `size`, so they stay the
+    same when news are added, deleted or published in between runs.
+    """
+    alias, index, backend = get_news_index(language)
+    news = index.index_queryset(using=alias)
+    qn = connections[news.db].ops.quote_name
+    column = '%s.%s' % (qn(News._meta.db_table), qn('id'))
+    # the distinct range starts are computed by the database, the pks never leave it
+    starts = (news.extra(select={'range_start': '%s - %s %%%% %%s' % (column, column)}, select_params=[size])
+                  .order_by('range_start')
+                  .values_list('range_start', flat=True)
+                  .distinct())
+    return [(int(start), int(start) + size - 1) for start in starts]
+
+
+def index_range(language, first, last, batch_size=100):
+    """
+    Updates the documents of the news in the given pk range in the search
+    backend of `language`, `batch_size` at a time. Returns their number.
+    """
+    alias, index, backend = get_news_index(language)
+    news = index.index_queryset(using=alias).filter(pk__gte=first, pk__lte=last).order_by('pk').distinct()
+    count = 0
+    batch = []
+    for item in news.iterator():
+        batch.append(item)
+        if len(batch) == batch_size:
+            backend.update(index, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        backend.update(index, batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from aldryn_news.indexing import process_queue
+
+
+class Command(NoArgsCommand):
+
+    help = 'Updates the search index documents of the news queued since the last run.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', action='store', type='int', dest='batch_size', default=100,
+                    help='Number of queued news translations handled at once (default 100).'),
+        make_option('--interval', action='store', type='int', dest='interval', default=0,
+                    help='Keep running, polling the queue every INTERVAL seconds.'),
+    )
+
+    def handle_noargs(self, **options):
+        while True:
+            count = process_queue(batch_size=options['batch_size'])
+            if count or not options['interval']:
+                self.stdout.write('Updated %d queued news translations.' % count)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from aldryn_news.counters import rebuild_counters
+
+
+class Command(NoArgsCommand):
+
+    help = 'Rebuilds the tag, category and month counters of the published news.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--language', action='append', dest='languages',
+                    help='Only rebuild the counters of this language (can be repeated).'),
+    )
+
+    def handle_noargs(self, **options):
+        count = rebuild_counters(languages=options.get('languages'))
+        self.stdout.write('Rebuilt %d news counters.' % count)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import json
+import multiprocessing
+import os
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connections
+
+from aldryn_news.indexing import get_pk_ranges, index_range
+from aldryn_news.utils import get_language_codes
+
+
+def close_connections():
+    # forked workers must not share the database connections of the parent
+    for connection in connections.all():
+        connection.close()
+
+
+def run_task(task):
+    language, first, last, batch_size = task
+    return language, first, last, index_range(language, first, last, batch_size=batch_size)
+
+
+class Command(NoArgsCommand):
+
+    help = ('Updates the search index documents of all published news, split in pk ranges per language '
+            'and processed in parallel. Restarts from the ranges completed by a previous run.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--language', action='append', dest='languages',
+                    help='Only index the news of this language (can be repeated).'),
+        make_option('--workers', action='store', type='int', dest='workers', default=multiprocessing.cpu_count(),
+                    help='Number of worker processes (default: number of CPUs).'),
+        make_option('--range-size', action='store', type='int', dest='range_size', default=1000,
+                    help='Number of consecutive pks per range (default 1000).'),
+        make_option('--batch-size', action='store', type='int', dest='batch_size', default=100,
+                    help='Number of news sent to the search backend at once (default 100).'),
+        make_option('--state-file', action='store', dest='state_file', default='rebuild_news_index.state',
+                    help='File recording the completed ranges (default rebuild_news_index.state).'),
+        make_option('--reset', action='store_true', dest='reset', default=False,
+                    help='Ignore the ranges completed by a previous run.'),
+    )
+
+    def handle_noargs(self, **options):
+        state_file = options['state_file']
+        if options['reset'] and os.path.exists(state_file):
+            os.remove(state_file)
+        completed = self.read_state(state_file)
+
+        tasks = []
+        for language in options.get('languages') or get_language_codes():
+            for first, last in get_pk_ranges(language, options['range_size']):
+                if (language, first, last) not in completed:
+                    tasks.append((language, first, last, options['batch_size']))
+        self.stdout.write('%d ranges to index, %d completed before.' % (len(tasks), len(completed)))
+
+        close_connections()
+        pool = multiprocessing.Pool(options['workers'], initializer=close_connections)
+        started = time.time()
+        total = 0
+        try:
+            with open(state_file, 'a') as state:
+                for language, first, last, count in pool.imap_unordered(run_task, tasks):
+                    state.write(json.dumps([language, first, last]) + '\n')
+                    state.flush()
+                    total += count
+                    elapsed = time.time() - started
+                    self.stdout.write('%s %d-%d: %d news (%.1f news/s overall)' % (
+                        language, first, last, count, total / elapsed if elapsed else 0))
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        elapsed = time.time() - started
+        self.stdout.write('Indexed %d news in %.1f s (%.1f news/s).' % (
+            total, elapsed, total / elapsed if elapsed else 0))
+        os.remove(state_file)
+
+    def read_state(self, state_file):
+        if not os.path.exists(state_file):
+            return set()
+        completed = set()
+        with open(state_file) as state:
+            for line in state:
+                if line.strip():
+                    language, first, last = json.loads(line)
+                    completed.add((language, first, last))
+        return completed
@@ -1,34 +1,177 @@
 # -*- coding: utf-8 -*-
 import datetime
-from collections import Counter
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connections, models
 from django.utils import timezone
+from django.utils.datastructures import SortedDict
+from django.utils.translation import get_language
 
+from hvad.manager import TranslationQueryset
 from hvad.models import TranslationManager
 
-from taggit.models import Tag, TaggedItem
+
+def get_published_filter(prefix=''):
+    """
+    Returns a Q object limiting news to the published ones.
+    Use `prefix` (e.g. 'news__') to apply it across a relation.
+    """
+    current = timezone.now()
+    return (models.Q(**{'%spublication_start__lte' % prefix: current}) &
+            (models.Q(**{'%spublication_end__isnull' % prefix: True}) |
+             models.Q(**{'%spublication_end__gte' % prefix: current})))
+
+
+def get_datetime_extract_sql(lookup_type, field_name, using):
+    """
+    Returns SQL (and params) extracting `lookup_type` (e.g. 'year') from a
+    datetime column, in the current time zone when time zone support is on.
+    """
+    ops = connections[using].ops
+    if settings.USE_TZ and hasattr(ops, 'datetime_extract_sql'):
+        return ops.datetime_extract_sql(lookup_type, field_name, timezone.get_current_timezone_name())
+    return ops.date_extract_sql(lookup_type, field_name), []
 
 
 class CategoryManager(TranslationManager):
 
-    def get_with_usage_count(self, language=None, news_ids=None, **kwargs):
-        if not news_ids:
-            news_ids = self.language(language).values_list('pk', flat=True)
+    def get_usage_counts(self, language=None, news_ids=None, published=False, use_counters=True, **kwargs):
+        """
+        Returns a SortedDict of category pk -> number of news translated into
+        `language`, ordered by count. Done in a single grouped query, or read
+        from the counters table for plain published counts.
+        """
+        language = language or get_language()
+        if published and use_counters and not news_ids and not kwargs:
+            from .models import NewsCounter
+            counts = NewsCounter.objects.get_counts(NewsCounter.CATEGORY, language)
+            return SortedDict((int(key), count) for key, count in counts.items())
 
-        kwargs['news__in'] = news_ids
+        # all the news conditions have to go into a single filter() call,
+        # otherwise django joins the news table once per call
+        kwargs['news__translations__language_code'] = language
+        if news_ids:
+            kwargs['news__in'] = news_ids
+        args = [get_published_filter('news__')] if published else []
 
-        categories = list(self.language(language).filter(**kwargs).distinct())
+        # hvad's TranslationQueryset doesn't support annotate, use the plain one
+        counts = (self.get_query_set()
+                      .filter(*args, **kwargs)
+                      .annotate(news_count=models.Count('news', distinct=True))
+                      .order_by('-news_count', 'ordering')
+                      .values_list('pk', 'news_count'))
+        return SortedDict(counts)
 
-        # No annotate in hvad.
+    def get_with_usage_count(self, language=None, news_ids=None, published=False, **kwargs):
+        """
+        Returns translated categories having a `news_count` attribute.
+        Results are ordered by count.
+        """
+        counts = self.get_usage_counts(language, news_ids=news_ids, published=published, **kwargs)
+        if not counts:
+            return []
+        categories = list(self.language(language).filter(pk__in=counts.keys()))
+        ordering = dict((pk, index) for index, pk in enumerate(counts))
         for category in categories:
-            category.news_count = category.news_set.count()
-        return sorted(categories, key=lambda x: -x.news_count)
+            category.news_count = counts[category.pk]
+        return sorted(categories, key=lambda x: ordering[x.pk])
+
+
+class NewsQuerySet(TranslationQueryset):
+
+    chunk_size = 100
+    _load_categories = False
+    _resolve_urls = False
+    _urls_language = None
+
+    def with_category(self, *related):
+        """
+        Loads the categories of the news with their translation in the
+        queryset language, one query per chunk of news while iterating.
+        Not a translated select_related(): hvad would leave out the news
+        whose category lacks that translation. Further (untranslated)
+        `related` fields are joined, select_related() calls don't add up
+        on this Django version, so pass 'key_visual' here.
+        """
+        clone = self if self._language_code else self.language()
+        clone = clone.select_related(*related) if related else clone._clone()
+        clone._load_categories = True
+        return clone
+
+    def tagged(self, slugs, match_all=False):
+        """
+        Filters the news tagged with any of the given tag slugs, or with all
+        of them if `match_all` is set. Done with subqueries on the tagged items,
+        the ids never leave the database.
+        """
+        language = self._language_code or get_language()
+        content_type = ContentType.objects.get_for_model(self.shared_model)
+        tagged_items = self.shared_model.tags.through.objects.filter(content_type=content_type)
+
+        def tagged_with(slugs):
+            # both conditions in a single filter() call, so they apply to the same translation
+            return (tagged_items.filter(tag__translations__language_code=language,
+                                        tag__translations__slug__in=slugs)
+                                .values('object_id'))
+
+        if not match_all:
+            return self.filter(pk__in=tagged_with(slugs))
+        qs = self
+        for slug in slugs:
+            qs = qs.filter(pk__in=tagged_with([slug]))
+        return qs
+
+    def tagged_by_pk(self, tag_ids):
+        """
+        Filters the news tagged with any of the given tags, in one subquery
+        on the tagged items, so no news is returned twice.
+        """
+        content_type = ContentType.objects.get_for_model(self.shared_model)
+        tagged_items = self.shared_model.tags.through.objects.filter(content_type=content_type,
+                                                                     tag__in=tag_ids)
+        return self.filter(pk__in=tagged_items.values('object_id'))
+
+    def with_urls(self, language=None):
+        """
+        Resolves the absolute urls of the news in bulk while iterating.
+        Urls are in `language`, the current language by default.
+        """
+        clone = self._clone()
+        clone._resolve_urls = True
+        clone._urls_language = language
+        return clone
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_load_categories', self._load_categories)
+        kwargs.setdefault('_resolve_urls', self._resolve_urls)
+        kwargs.setdefault('_urls_language', self._urls_language)
+        return super(NewsQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def iterator(self):
+        iterator = super(NewsQuerySet, self).iterator()
+        if not (self._load_categories or self._resolve_urls):
+            for obj in iterator:
+                yield obj
+            return
+        from .models import load_categories, resolve_news_urls
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+            if self._load_categories:
+                load_categories(chunk, self._language_code or get_language())
+            if self._resolve_urls:
+                chunk = resolve_news_urls(chunk, self._urls_language)
+            for obj in chunk:
+                yield obj
 
 
 class RelatedManager(TranslationManager):
 
+    queryset_class = NewsQuerySet
+
     def using_translations(self):
         # not overriding get_queryset, as hvad doesn't use that
         qs = super(RelatedManager, self).using_translations()
@@ -37,43 +180,71 @@ class RelatedManager(TranslationManager):
         qs = qs.order_by('-publication_start')
         return qs
 
-    def get_tags(self, language, news_ids=None):
-        """Returns tags used to tag news and its count. Results are ordered by count."""
+    def filter_language(self, language=None):
+        """
+        Returns an untranslated queryset of news translated into `language`.
+        Unlike hvad's translated queryset, it supports aggregation.
+        """
+        language = language or get_language()
+        return self.get_query_set().filter(translations__language_code=language)
 
-        # get tagged news
+    def get_tag_counts(self, language, news_ids=None, limit=None):
+        """
+        Returns a SortedDict of tag pk -> number of tagged news, ordered by count.
+        Counting, ordering and limiting is done by the database; the news are
+        restricted through a subquery instead of a list of ids.
+        """
+        tagged_items = self.model.tags.through
+        news = self.filter_language(language)
+        if news_ids:
+            news = news.filter(pk__in=news_ids)
 
-        if not news_ids:
-            news_ids = self.language(language).values_list('pk', flat=True)
+        counts = (tagged_items.objects
+                              .filter(content_type=ContentType.objects.get_for_model(self.model),
+                                      object_id__in=news.values('pk'))
+                              .values('tag')
+                              .annotate(count=models.Count('object_id', distinct=True))
+                              .order_by('-count', 'tag')
+                              .values_list('tag', 'count'))
+        if limit:
+            counts = counts[:limit]
+        return SortedDict(counts)
+
+    def get_tags(self, language, news_ids=None, limit=None):
+        """Returns tags used to tag news and its count. Results are ordered by count."""
+        counts = self.get_tag_counts(language, news_ids=news_ids, limit=limit)
+        if not counts:
+            return []
+        tag_model = self.model.tags.through.tag_model()
+        tags = list(tag_model.objects.language(language).filter(pk__in=counts.keys()))
+        ordering = dict((pk, index) for index, pk in enumerate(counts))
+        for tag in tags:
+            tag.count = counts[tag.pk]
+        return sorted(tags, key=lambda x: ordering[x.pk])
 
-        kwargs = {
-            "object_id__in": set(news_ids),
-            "content_type": ContentType.objects.get_for_model(self.model)
-        }
+    def get_months(self, language, category=None, tag=None):
+        """
+        Get months with aggregated count (how much news is in the month). Results are ordered by date.
+        Optionally limited to news in the given `category` and/or tagged with `tag`.
+        """
+        news = self.filter_language(language)
+        if category:
+            news = news.filter(category=category)
+        if tag:
+            news = news.filter(tagged_items__tag=tag)
 
-        # aggregate and sort
-        counted_tags = dict(TaggedItem.objects
-                                      .filter(**kwargs)
-                                      .values('tag')
-                                      .annotate(count=models.Count('tag'))
-                                      .values_list('tag', 'count'))
+        qn = connections[news.db].ops.quote_name
+        column = '%s.%s' % (qn(self.model._meta.db_table), qn('publication_start'))
+        # one extra() call per lookup keeps the select params in order
+        for lookup_type in ('year', 'month'):
+            sql, params = get_datetime_extract_sql(lookup_type, column, news.db)
+            news = news.extra(select={lookup_type: sql}, select_params=params)
 
-        # and finally get the results
-        tags = Tag.objects.filter(pk__in=counted_tags.keys())
-        for tag in tags:
-            tag.count = counted_tags[tag.pk]
-        return sorted(tags, key=lambda x: -x.count)
-
-    def get_months(self, language):
-        """Get months with aggregatet count (how much news is in the month). Results are ordered by date."""
-        # done via naive way as django's having tough time while aggregating on date fields
-        news = self.language(language)
-        dates = news.values_list('publication_start', flat=True)
-        dates = [(x.year, x.month) for x in dates]
-        date_counter = Counter(dates)
-        dates = set(dates)
-        dates = sorted(dates, reverse=True)
-        return [{'date': datetime.date(year=year, month=month, day=1),
-                 'count': date_counter[year, month]} for year, month in dates]
+        months = (news.values('year', 'month')
+                      .annotate(count=models.Count('pk', distinct=True))
+                      .order_by('-year', '-month'))
+        return [{'date': datetime.date(year=int(month['year']), month=int(month['month']), day=1),
+                 'count': month['count']} for month in months]
 
 
 class PublishedManager(RelatedManager):
@@ -81,12 +252,57 @@ class PublishedManager(RelatedManager):
     def using_translations(self):
         # not overriding get_queryset, as hvad doesn't use that
         qs = super(PublishedManager, self).using_translations()
-        qs = qs.filter(publication_start__lte=timezone.now())
-        qs = qs.filter(models.Q(publication_end__isnull=True) | models.Q(publication_end__gte=timezone.now()))
-        return qs
+        return qs.filter(get_published_filter())
+
+    def filter_language(self, language=None):
+        qs = super(PublishedManager, self).filter_language(language)
+        return qs.filter(get_published_filter())
+
+    # Counts of all published news are maintained in the counters table,
+    # pass use_counters=False to aggregate the news table instead.
+
+    def get_tag_counts(self, language, news_ids=None, limit=None, use_counters=True):
+        if news_ids or not use_counters:
+            return super(PublishedManager, self).get_tag_counts(language, news_ids=news_ids, limit=limit)
+        from .models import NewsCounter
+        counts = NewsCounter.objects.get_counts(NewsCounter.TAG, language, limit=limit)
+        return SortedDict((int(key), count) for key, count in counts.items())
+
+    def get_months(self, language, category=None, tag=None, use_counters=True):
+        if category or tag or not use_counters:
+            return super(PublishedManager, self).get_months(language, category=category, tag=tag)
+        from .models import NewsCounter
+        counts = NewsCounter.objects.get_counts(NewsCounter.MONTH, language)
+        return [{'date': datetime.date(year=int(key[:4]), month=int(key[5:7]), day=1),
+                 'count': count} for key, count in counts.items()]
 
 
 class TagManager(TranslationManager):
 
     def get_query_set(self):
         return self.language()
+
+
+class NewsCounterManager(models.Manager):
+
+    def get_counts(self, kind, language, limit=None):
+        """
+        Returns a SortedDict of key -> count. Months are ordered by date (newest first),
+        everything else by count.
+        """
+        counters = self.filter(kind=kind, language_code=language, count__gt=0)
+        if kind == self.model.MONTH:
+            counters = counters.order_by('-key')
+        else:
+            counters = counters.order_by('-count', 'key')
+        counters = counters.values_list('key', 'count')
+        if limit:
+            counters = counters[:limit]
+        return SortedDict(counters)
+
+    def set_count(self, kind, language, key, count):
+        lookup = {'kind': kind, 'language_code': language, 'key': key}
+        if not count:
+            self.filter(**lookup).delete()
+        elif not self.filter(**lookup).update(count=count):
+            self.get_or_create(defaults={'count': count}, **lookup)
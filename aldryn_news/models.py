@@ -5,7 +5,7 @@ from django.template.defaultfilters import slugify
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse, NoReverseMatch
-from django.db import models
+from django.db import connections, models
 from django.utils.translation import ugettext_lazy as _, override
 from django.utils.timezone import now
 
@@ -23,6 +23,7 @@ from unidecode import unidecode
 
 from .managers import (
     CategoryManager,
+    NewsCounterManager,
     RelatedManager,
     PublishedManager,
     TagManager,
@@ -43,6 +44,11 @@ def get_slug_in_language(record, language):
             return translation.slug
 
 
+def has_cached_translation(record, language):
+    translation = getattr(record, record._meta.translations_cache, None)
+    return translation is not None and translation.language_code == language
+
+
 def get_page_url(name, language):
     try:
         url = reverse(name)
@@ -148,16 +154,19 @@ class News(TranslatableModel):
                                           'WARNING! Used in the URL. If changed, the URL will change. ')),
         lead_in=HTMLField(_('Lead-in'),
                           help_text=_('Will be displayed in lists, and at the start of the detail page')),
+        # not called `modified`, hvad would take it for the shared field
+        translation_modified=models.DateTimeField(_('Modified'), auto_now=True),
         meta={'unique_together': [['slug', 'language_code']]}
     )
     key_visual = FilerImageField(verbose_name=_('Key Visual'), blank=True, null=True)
     content = PlaceholderField('blog_post_content')
-    publication_start = models.DateTimeField(_('Published Since'), default=datetime.datetime.now,
+    publication_start = models.DateTimeField(_('Published Since'), default=datetime.datetime.now, db_index=True,
                                              help_text=_('Used in the URL. If changed, the URL will change.'))
     publication_end = models.DateTimeField(_('Published Until'), null=True, blank=True)
     category = models.ForeignKey(Category, verbose_name=_('Category'), blank=True, null=True,
                                  help_text=_('WARNING! Used in the URL. If changed, the URL will change.'))
     external_url = models.URLField(max_length=1000, null=True, blank=True)
+    modified = models.DateTimeField(_('Modified'), auto_now=True)
     objects = RelatedManager()
     published = PublishedManager()
     tags = TaggableManager(blank=True, through=TaggedItem)
@@ -170,15 +179,33 @@ class News(TranslatableModel):
     def __unicode__(self):
         return self.lazy_translation_getter('title', str(self.pk))
 
+    def save(self, *args, **kwargs):
+        # slugs, category or date may change
+        self.__dict__.pop('_absolute_urls', None)
+        super(News, self).save(*args, **kwargs)
+
+    def get_last_modified(self):
+        """Latest change of the news, its translation or its content in the translation language."""
+        modified = [self.modified, self.lazy_translation_getter('translation_modified')]
+        return max(value for value in modified if value)
+
     def get_absolute_url(self, language=None):
         if self.external_url:
             return self.external_url
         language = language or get_current_language()
-        slug = get_slug_in_language(self, language)
+        urls = self.__dict__.setdefault('_absolute_urls', {})
+        if language not in urls:
+            slug = get_slug_in_language(self, language)
+            category_slug = get_slug_in_language(self.category, language) if self.category_id else None
+            urls[language] = self.build_absolute_url(language, slug, category_slug)
+        return urls[language]
+
+    def build_absolute_url(self, language, slug, category_slug):
+        """Builds the url from already known slugs, see resolve_news_urls."""
         with override(language):
             if not slug:   # news not translated in given language
-                if self.category:
-                    return self.category.get_absolute_url(language=language)
+                if category_slug:
+                    return reverse('aldryn_news:news-category', kwargs={'category_slug': category_slug})
 
                 try:
                     return get_page_url('latest-news', language)
@@ -192,13 +219,143 @@ class News(TranslatableModel):
                 'slug': slug
             }
 
-            category_slug = get_slug_in_language(self.category, language)
             if category_slug:
                 kwargs['category_slug'] = category_slug
 
             return reverse('aldryn_news:news-detail', kwargs=kwargs)
 
 
+def load_categories(news_list, language):
+    """
+    Sets the categories of many news at once, with their translation in
+    `language`, in a single query. Categories lacking that translation are
+    left to load lazily, as usual.
+    """
+    category_ids = set(news.category_id for news in news_list if news.category_id)
+    if not category_ids:
+        return news_list
+    categories = Category.objects.language(language).filter(pk__in=category_ids)
+    categories = dict((category.pk, category) for category in categories)
+    category_cache = News._meta.get_field('category').get_cache_name()
+    for news in news_list:
+        if news.category_id in categories:
+            setattr(news, category_cache, categories[news.category_id])
+    return news_list
+
+
+def resolve_news_urls(news_list, language=None):
+    """
+    Resolves the absolute urls of many news at once and memoises them on the
+    instances, so later get_absolute_url calls don't hit the database.
+    The news and category slugs are fetched in a single query.
+    Returns the news as a list.
+    """
+    news_list = list(news_list)
+    language = language or get_current_language()
+    pending = []
+    category_cache = News._meta.get_field('category').get_cache_name()
+    for news in news_list:
+        if news.external_url or language in news.__dict__.get('_absolute_urls', {}):
+            continue
+        category = getattr(news, category_cache, None)
+        if (has_cached_translation(news, language) and
+                (not news.category_id or category and has_cached_translation(category, language))):
+            # categories loaded with_category(), no need to query
+            news.get_absolute_url(language)
+        else:
+            pending.append(news)
+    if not pending:
+        return news_list
+
+    slugs = News.objects.get_query_set().filter(pk__in=[news.pk for news in pending])
+    qn = connections[slugs.db].ops.quote_name
+    news_table = qn(News._meta.db_table)
+    for name, model, column in (('news_slug', News, news_table + '.' + qn('id')),
+                                ('category_slug', Category, news_table + '.' + qn('category_id'))):
+        translations = qn(model._meta.translations_model._meta.db_table)
+        sql = ('SELECT %(table)s.%(slug)s FROM %(table)s '
+               'WHERE %(table)s.%(master)s = %(column)s AND %(table)s.%(language)s = %%s') % {
+            'table': translations, 'slug': qn('slug'), 'master': qn('master_id'),
+            'language': qn('language_code'), 'column': column}
+        # one extra() call per subquery keeps the select params in order
+        slugs = slugs.extra(select={name: sql}, select_params=[language])
+    slugs = dict((pk, (slug, category_slug))
+                 for pk, slug, category_slug in slugs.values_list('pk', 'news_slug', 'category_slug'))
+
+    for news in pending:
+        slug, category_slug = slugs.get(news.pk, (None, None))
+        news.__dict__.setdefault('_absolute_urls', {})[language] = news.build_absolute_url(language, slug, category_slug)
+    return news_list
+
+
+class NewsCounter(models.Model):
+    """
+    Denormalised number of published news per language and tag, category or month.
+    Kept up to date by the handlers in aldryn_news.signals, rebuilt by the
+    rebuild_news_counters management command.
+    """
+    TAG = 'tag'
+    CATEGORY = 'category'
+    MONTH = 'month'
+
+    KINDS = (
+        (TAG, _('Tag')),
+        (CATEGORY, _('Category')),
+        (MONTH, _('Month')),
+    )
+
+    kind = models.CharField(_('Kind'), choices=KINDS, max_length=10)
+    language_code = models.CharField(_('Language'), max_length=15)
+    key = models.CharField(_('Key'), max_length=20, help_text=_('Tag or category id, or month as YYYY-MM.'))
+    count = models.PositiveIntegerField(_('Count'), default=0)
+
+    objects = NewsCounterManager()
+
+    class Meta:
+        verbose_name = _('News counter')
+        verbose_name_plural = _('News counters')
+        unique_together = [['kind', 'language_code', 'key']]
+
+    def __unicode__(self):
+        return u'%s %s (%s): %d' % (self.kind, self.key, self.language_code, self.count)
+
+
+class PublicationCheckpoint(models.Model):
+    """
+    The moment up to which news entering or leaving the published window were
+    handled, see aldryn_news.cache. A single row, kept in the database as the
+    cache may lose it.
+    """
+    processed_until = models.DateTimeField(_('Processed until'))
+
+    class Meta:
+        verbose_name = _('Publication checkpoint')
+        verbose_name_plural = _('Publication checkpoints')
+
+    def __unicode__(self):
+        return u'%s' % self.processed_until
+
+
+class SearchQueueItem(models.Model):
+    """
+    A news translation whose search index document is out of date. Queued
+    by the handlers in aldryn_news.signals, drained by the
+    process_news_search_queue management command.
+    """
+    # not a foreign key, deleted news stay queued to be removed from the index
+    news_id = models.PositiveIntegerField(_('News id'))
+    language_code = models.CharField(_('Language'), max_length=15)
+    queued_at = models.DateTimeField(_('Queued at'), default=now, db_index=True)
+
+    class Meta:
+        verbose_name = _('Search queue item')
+        verbose_name_plural = _('Search queue items')
+        unique_together = [['news_id', 'language_code']]
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.news_id, self.language_code)
+
+
 class LatestNewsPlugin(CMSPlugin):
 
     FULL = 'full'
@@ -219,21 +376,53 @@ class LatestNewsPlugin(CMSPlugin):
     def copy_relations(self, oldinstance):
         self.tags = oldinstance.tags.all()
 
+    @staticmethod
+    def get_news_queryset(language, tag_ids=None):
+        """Published news in `language`, tagged with any of `tag_ids` if given."""
+        news = News.published.language(language).with_category('key_visual')
+        if tag_ids:
+            news = news.tagged_by_pk(list(tag_ids))
+        return news
+
     def get_news(self):
-        news = News.published.language(self.language).select_related('category')
-        tags = list(self.tags.all())
-        if tags:
-            tagged_news = News.objects.filter(tags__in=tags)
-            news = news.filter(id__in=tagged_news)
-        return news[:self.latest_entries]
+        # news tags share the primary keys of the taggit tags chosen here
+        tag_ids = [tag.pk for tag in self.tags.all()]
+        return self.get_news_queryset(self.language, tag_ids).with_urls()[:self.latest_entries]
 
 
 class NewsLinksPlugin(CMSPlugin):
 
-    news = models.ManyToManyField(News, verbose_name=_("News"))
+    news = models.ManyToManyField(News, verbose_name=_("News"), through='NewsLink')
 
     def copy_relations(self, oldinstance):
-        self.news = oldinstance.news.all()
+        links = oldinstance.news_links.values_list('news', 'position')
+        NewsLink.objects.bulk_create([NewsLink(newslinksplugin=self, news_id=news_id, position=position)
+                                      for news_id, position in links])
 
     def get_news(self):
-        return self.news.all()
+        news = News.objects.language(self.language).with_category('key_visual')
+        news = news.filter(newslink__newslinksplugin=self).order_by('newslink__position', 'newslink__id')
+        return news.with_urls()
+
+
+class NewsLink(models.Model):
+    """A news shown by a NewsLinksPlugin, in the order chosen by the editor."""
+
+    newslinksplugin = models.ForeignKey(NewsLinksPlugin, related_name='news_links')
+    news = models.ForeignKey(News, verbose_name=_("News"))
+    position = models.PositiveIntegerField(_('Position'), default=0)
+
+    class Meta:
+        # the table of the former automatic many to many relation
+        db_table = 'aldryn_news_newslinksplugin_news'
+        ordering = ['position', 'id']
+        unique_together = [['newslinksplugin', 'news']]
+        verbose_name = _('News link')
+        verbose_name_plural = _('News links')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.position, self.news)
+
+
+# connect the signal handlers
+from aldryn_news import signals  # noqa
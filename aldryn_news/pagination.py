@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset (cursor) pagination on (publication_start, id).
+
+Instead of OFFSET, the next page continues after the last item of the
+current one, so deep pages are as cheap as the first and no COUNT query is
+needed. Cursors are opaque, URL safe strings.
+"""
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+ORDERING = ('-publication_start', '-id')
+
+
+def encode_cursor(news):
+    value = '%s|%d' % (news.publication_start.isoformat(), news.pk)
+    return base64.urlsafe_b64encode(value.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (publication_start, pk) of a cursor. Raises ValueError for invalid cursors."""
+    try:
+        padded = str(cursor) + '=' * (-len(cursor) % 4)
+        publication_start, pk = base64.urlsafe_b64decode(padded).decode('ascii').rsplit('|', 1)
+        publication_start, pk = parse_datetime(publication_start), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor: %r' % cursor)
+    if publication_start is None:
+        raise ValueError('Invalid cursor: %r' % cursor)
+    return publication_start, pk
+
+
+def filter_after(queryset, cursor):
+    """Returns the news of `queryset` following the cursor, in cursor order."""
+    queryset = queryset.order_by(*ORDERING)
+    if cursor:
+        publication_start, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(publication_start__lt=publication_start) |
+                                   Q(publication_start=publication_start, id__lt=pk))
+    return queryset
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        # keyset pages only know the way forward, but can link back to the start
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate(queryset, cursor=None, page_size=10):
+    """Returns the KeysetPage following `cursor`. Fetches one extra row instead of counting."""
+    object_list = list(filter_after(queryset, cursor)[:page_size + 1])
+    next_cursor = None
+    if len(object_list) > page_size:
+        object_list = object_list[:page_size]
+        next_cursor = encode_cursor(object_list[-1])
+    return KeysetPage(object_list, cursor=cursor, next_cursor=next_cursor)
@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.core.cache import cache
 from django.template import RequestContext
+from django.utils.encoding import force_text
 
 from aldryn_search.utils import get_index_base, strip_tags
 
+from aldryn_news.managers import get_published_filter
 from aldryn_news.models import News
 
+# plugin text is keyed by the change date of the plugin, so it never goes stale
+PLUGIN_TEXT_CACHE_TIMEOUT = getattr(settings, 'ALDRYN_NEWS_PLUGIN_TEXT_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+
+def get_plugin_text_key(plugin):
+    return 'aldryn_news_plugin_text:%s:%s' % (plugin.pk, plugin.changed_date.isoformat())
+
 
 class NewsIndex(get_index_base()):
     haystack_use_for_indexing = getattr(settings, "ALDRYN_NEWS_SEARCH", True)
@@ -19,18 +29,34 @@ class NewsIndex(get_index_base()):
         return {'translations__language_code': language}
 
     def get_index_queryset(self, language):
-        return self.get_model().published.all()
+        # the published filter lives in using_translations(), all() would return every news
+        return self.get_model().objects.get_query_set().filter(get_published_filter())
 
     def get_model(self):
         return News
 
     def get_search_data(self, obj, language, request):
         text_bits = [strip_tags(obj.lead_in)]
-        plugins = obj.content.cmsplugin_set.filter(language=language)
+        plugins = list(obj.content.cmsplugin_set.filter(language=language))
+        keys = dict((plugin.pk, get_plugin_text_key(plugin)) for plugin in plugins)
+        cached = cache.get_many(keys.values())
+        extracted = {}
         for base_plugin in plugins:
-            instance, plugin_type = base_plugin.get_plugin_instance()
-            if not instance is None:
-                plugin_content = strip_tags(instance.render_plugin(context=RequestContext(request)))
-                text_bits.append(plugin_content)
-
-        return ' '.join(text_bits)
+            key = keys[base_plugin.pk]
+            if key not in cached:
+                extracted[key] = self.get_plugin_text(base_plugin, request)
+            text_bits.append(cached.get(key, extracted.get(key)))
+        if extracted:
+            cache.set_many(extracted, PLUGIN_TEXT_CACHE_TIMEOUT)
+
+        return ' '.join(bit for bit in text_bits if bit)
+
+    def get_plugin_text(self, base_plugin, request):
+        instance, plugin_type = base_plugin.get_plugin_instance()
+        if instance is None:
+            return ''
+        # plugins listing their text fields are read without rendering
+        search_fields = getattr(plugin_type, 'search_fields', None) or getattr(instance, 'search_fields', None)
+        if search_fields:
+            return ' '.join(strip_tags(force_text(getattr(instance, field) or '')) for field in search_fields)
+        return strip_tags(instance.render_plugin(context=RequestContext(request)))
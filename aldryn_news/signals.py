@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from cms.models.pluginmodel import CMSPlugin
+
+from aldryn_news import cache, indexing
+from aldryn_news.counters import get_counter_keys, get_stored_counter_keys, update_counters
+from aldryn_news.models import (Category, LatestNewsPlugin, News, NewsCounter, NewsLink, NewsLinksPlugin,
+                                Tag, TaggedItem)
+
+NewsTranslation = News._meta.translations_model
+
+
+def is_news_tag(tagged_item):
+    return tagged_item.content_type_id == ContentType.objects.get_for_model(News).pk
+
+
+def remember_counter_keys(sender, instance, **kwargs):
+    # the category or month may change, so the old keys need recounting too
+    if instance.pk and not kwargs.get('raw'):
+        instance._counter_keys = get_stored_counter_keys(instance.pk)
+
+
+def update_news_counters(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    keys = getattr(instance, '_counter_keys', set())
+    if 'created' in kwargs:  # saved, not deleted
+        keys = keys | get_counter_keys(instance.pk, instance.category_id, instance.publication_start)
+    update_counters(keys)
+
+
+def update_tag_counters(sender, instance, **kwargs):
+    if not kwargs.get('raw') and is_news_tag(instance):
+        update_counters([(NewsCounter.TAG, str(instance.tag_id))])
+
+
+def update_translation_counters(sender, instance, **kwargs):
+    if not kwargs.get('raw') and instance.master_id:
+        update_counters(get_stored_counter_keys(instance.master_id), languages=[instance.language_code])
+
+pre_save.connect(remember_counter_keys, sender=News)
+pre_delete.connect(remember_counter_keys, sender=News)
+post_save.connect(update_news_counters, sender=News)
+post_delete.connect(update_news_counters, sender=News)
+post_save.connect(update_tag_counters, sender=TaggedItem)
+post_delete.connect(update_tag_counters, sender=TaggedItem)
+post_save.connect(update_translation_counters, sender=NewsTranslation)
+post_delete.connect(update_translation_counters, sender=NewsTranslation)
+
+
+def touch_tagged_news(sender, instance, **kwargs):
+    # the tags are shown with the news, its last modification moves along
+    if not kwargs.get('raw') and is_news_tag(instance):
+        News.objects.filter(pk=instance.object_id).update(modified=timezone.now())
+
+
+def touch_translated_news(sender, instance, **kwargs):
+    # renaming a category or tag changes the pages of its news
+    if kwargs.get('raw') or not instance.master_id:
+        return
+    if sender is Category._meta.translations_model:
+        news = News.objects.filter(category=instance.master_id)
+    else:
+        news = News.objects.filter(tagged_items__tag=instance.master_id)
+    news.update(modified=timezone.now())
+
+post_save.connect(touch_tagged_news, sender=TaggedItem)
+post_delete.connect(touch_tagged_news, sender=TaggedItem)
+for model in (Category._meta.translations_model, Tag._meta.translations_model):
+    post_save.connect(touch_translated_news, sender=model)
+    post_delete.connect(touch_translated_news, sender=model)
+
+
+def update_crossed_news_counters(sender, since, until, **kwargs):
+    crossed = cache.get_crossed_news(since, until).values_list('pk', 'category', 'publication_start')
+    keys = set()
+    for news_id, category_id, publication_start in crossed:
+        keys.update(get_counter_keys(news_id, category_id, publication_start))
+    update_counters(keys)
+
+cache.publication_boundary_passed.connect(update_crossed_news_counters)
+
+
+def invalidate_cache(sender, **kwargs):
+    if not kwargs.get('raw'):
+        cache.invalidate()
+
+for model in (News, NewsTranslation, Category, Category._meta.translations_model,
+              Tag, Tag._meta.translations_model, TaggedItem, NewsLink):
+    post_save.connect(invalidate_cache, sender=model)
+    post_delete.connect(invalidate_cache, sender=model)
+
+
+def update_plugin_news(sender, instance, **kwargs):
+    # sent for every model, plugins are CMSPlugin subclasses
+    if kwargs.get('raw') or not isinstance(instance, CMSPlugin) or not instance.placeholder_id:
+        return
+    news_ids = list(News.objects.filter(content=instance.placeholder_id).values_list('pk', flat=True))
+    if news_ids:  # content of news
+        cache.invalidate()
+        translations = NewsTranslation.objects.filter(master__in=news_ids, language_code=instance.language)
+        translations.update(translation_modified=timezone.now())
+        indexing.queue_news(news_ids, languages=[instance.language])
+    elif isinstance(instance, (LatestNewsPlugin, NewsLinksPlugin)):
+        # their news lists are cached under the cache version
+        cache.invalidate()
+    else:
+        # anything else only shows up around the news on cached pages
+        cache.invalidate_pages()
+
+post_save.connect(update_plugin_news)
+post_delete.connect(update_plugin_news)
+
+
+# search index queue
+
+def queue_news(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        indexing.queue_news([instance.pk])
+
+
+def queue_translation(sender, instance, **kwargs):
+    if not kwargs.get('raw') and instance.master_id:
+        indexing.queue_news([instance.master_id], languages=[instance.language_code])
+
+
+def queue_crossed_news(sender, since, until, **kwargs):
+    indexing.queue_news(cache.get_crossed_news(since, until).values_list('pk', flat=True))
+
+if indexing.SEARCH:
+    post_save.connect(queue_news, sender=News)
+    post_delete.connect(queue_news, sender=News)
+    post_save.connect(queue_translation, sender=NewsTranslation)
+    post_delete.connect(queue_translation, sender=NewsTranslation)
+    cache.publication_boundary_passed.connect(queue_crossed_news)
@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
-from sitemap import NewsCategoriesSitemap, NewsSitemap
+from sitemap import NewsCategoriesSitemap, NewsSitemap, get_news_sitemaps
+
+__all__ = ['NewsCategoriesSitemap', 'NewsSitemap', 'get_news_sitemaps']
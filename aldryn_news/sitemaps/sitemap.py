@@ -1,23 +1,84 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Q
 
 from ..models import Category, News
+from ..utils import get_date_range, get_language_codes
+
+SITEMAP_LIMIT = getattr(settings, 'ALDRYN_NEWS_SITEMAP_LIMIT', 1000)
+
+
+class PageIterator(object):
+    """
+    Hands a queryset to the sitemap paginator: it is counted with count()
+    and each page is loaded with iterator(), so it's never cached in full.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        return self.queryset[k].iterator()
 
 
 class NewsCategoriesSitemap(Sitemap):
     changefreq = "never"
     priority = 0.5
 
+    def __init__(self, language=None):
+        self.language = language
+
     def items(self):
-        return Category.objects.all()
+        return Category.objects.language(self.language).order_by('ordering', 'id')
+
+    def location(self, obj):
+        return obj.get_absolute_url(self.language)
 
 
 class NewsSitemap(Sitemap):
     changefreq = "yearly"
     priority = 0.5
+    limit = SITEMAP_LIMIT
+
+    def __init__(self, language=None, year=None):
+        self.language = language
+        self.year = year
 
     def items(self):
-        return News.published.all()
+        news = (News.published.language(self.language)
+                              .filter(Q(external_url__isnull=True) | Q(external_url=''))
+                              .order_by('-publication_start', '-id'))
+        if self.year:
+            start, end = get_date_range(self.year)
+            news = news.filter(publication_start__gte=start, publication_start__lt=end)
+        return PageIterator(news.with_urls(self.language))
+
+    def location(self, obj):
+        return obj.get_absolute_url(self.language)
 
     def lastmod(self, obj):
-        return obj.publication_start
+        return obj.get_last_modified()
+
+
+def get_news_sitemaps(languages=None, by_year=False):
+    """
+    Returns the sitemaps for django.contrib.sitemaps.views.index, one section
+    per language (and year, if `by_year`), each paginated by ALDRYN_NEWS_SITEMAP_LIMIT.
+    """
+    sitemaps = {}
+    for language in languages or get_language_codes():
+        sitemaps['news-categories-%s' % language] = NewsCategoriesSitemap(language)
+        if not by_year:
+            sitemaps['news-%s' % language] = NewsSitemap(language)
+            continue
+        years = set(month['date'].year for month in News.published.get_months(language))
+        for year in years:
+            sitemaps['news-%s-%d' % (language, year)] = NewsSitemap(language, year)
+    return sitemaps
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.conf.urls import patterns, url
 
+from aldryn_news.api import NewsJSONView
 from aldryn_news.views import ArchiveView, CategoryListView, NewsDetailView, TaggedListView
 from aldryn_news.feeds import CategoryFeed, LatestEntriesFeed, TagFeed
 from aldryn_news.utils import redirect_to_viewname
@@ -8,8 +9,9 @@ from aldryn_news.utils import redirect_to_viewname
 urlpatterns = patterns('',
     url(r'^$', ArchiveView.as_view(), name='latest-news'),
     url(r'^feed/$', LatestEntriesFeed(), name='latest-news-feed'),
-    url(r'^tagged/(?P<tag>[-\w]+)/$', TaggedListView.as_view(), name='tagged-news'),
-    url(r'^tagged/(?P<tag>[-\w]+)/feed/$', TagFeed(), name='tagged-news-feed'),
+    url(r'^api/news/$', NewsJSONView.as_view(), name='news-api'),
+    url(r'^tagged/(?P<tag>[-\w]+(?:[+,][-\w]+)*)/$', TaggedListView.as_view(), name='tagged-news'),
+    url(r'^tagged/(?P<tag>[-\w]+(?:[+,][-\w]+)*)/feed/$', TagFeed(), name='tagged-news-feed'),
     url(r'^(?P<year>\d{4})/$', ArchiveView.as_view(), name='archive-year'),
     url(r'^(?P<year>\d{4})/(?P<month>\d{1,2})/$', ArchiveView.as_view(), name='archive-month'),
     url(r'^(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/$', redirect_to_viewname, {'viewname': 'archive-month', 'keys': ['year', 'month']}),
@@ -1,7 +1,73 @@
 # -*- coding: utf-8 -*-
+import datetime
+import math
+
+from django.conf import settings
 from django.shortcuts import redirect
+from django.utils import timezone
 
 
 def redirect_to_viewname(request, viewname, keys, **kwargs):
     kwargs = dict((x, y) for x, y in kwargs.iteritems() if x in keys)
     return redirect(viewname, **kwargs)
+
+
+def get_language_codes():
+    return [code for code, name in settings.LANGUAGES]
+
+
+def make_aware(value, tz=None):
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, tz or timezone.get_current_timezone())
+    return value
+
+
+def get_date_range(year, month=None, day=None, tz=None):
+    """
+    Returns the half-open (start, end) datetime range covering the given
+    year, month or day, so it can be used with index-friendly __gte/__lt lookups.
+    The range is in `tz`, the current time zone by default.
+    Raises ValueError for impossible dates.
+    """
+    year = int(year)
+    if day:
+        start = datetime.datetime(year, int(month), int(day))
+        end = start + datetime.timedelta(days=1)
+    elif month:
+        month = int(month)
+        start = datetime.datetime(year, month, 1)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    else:
+        start = datetime.datetime(year, 1, 1)
+        end = datetime.datetime(year + 1, 1, 1)
+    return make_aware(start, tz), make_aware(end, tz)
+
+
+def get_month_key(value):
+    """Returns 'YYYY-MM' for a date(time), in the current time zone."""
+    if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return '%04d-%02d' % (value.year, value.month)
+
+
+def parse_tag_slugs(value):
+    """
+    Parses the tags of a tag url, 'a+b' meaning tagged with both a and b,
+    'a,b' tagged with either. Returns (slugs, match_all).
+    """
+    if '+' in value and ',' in value:
+        raise ValueError('Tags can either be combined with "+" or with ",".')
+    if '+' in value:
+        return value.split('+'), True
+    return value.split(','), False
+
+
+def get_weight_tier(count, min_count, max_count, tiers):
+    """
+    Returns the tier, from 1 to `tiers`, of `count` on a logarithmic scale
+    between `min_count` and `max_count`, as used for tag clouds.
+    """
+    if max_count <= min_count or tiers < 2:
+        return 1
+    ratio = (math.log(count) - math.log(min_count)) / (math.log(max_count) - math.log(min_count))
+    return 1 + int(round(ratio * (tiers - 1)))
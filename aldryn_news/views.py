@@ -1,17 +1,30 @@
 # -*- coding: utf-8 -*-
 import datetime
 
+from django.conf import settings
+from django.core.cache import cache as cache_backend
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import parse_http_date_safe
+from django.utils.translation import get_language, ugettext as _
 from django.views.generic.dates import ArchiveIndexView
 from django.views.generic.detail import DetailView
+from django.views.decorators.http import condition
 from django.views.generic.list import ListView
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 
-from aldryn_news import request_news_identifier
-from aldryn_news.models import News, Category, Tag
+from aldryn_news import cache, request_news_identifier
+from aldryn_news.models import News, Category
+from aldryn_news.pagination import paginate
+from aldryn_news.utils import get_date_range, parse_tag_slugs
 
+from cms.utils.conf import get_cms_setting
 from menus.utils import set_language_changer
 
+PAGINATE_BY = getattr(settings, 'ALDRYN_NEWS_PAGINATE_BY', 10)
+PAGE_CACHE = getattr(settings, 'ALDRYN_NEWS_PAGE_CACHE', False)
+
 
 class BaseNewsView(object):
 
@@ -20,10 +33,99 @@ class BaseNewsView(object):
             manager = News.objects
         else:
             manager = News.published
-        return manager.language()
-
+        return manager.language().with_category('key_visual').with_urls()
+
+
+class ConditionalGetMixin(object):
+    """
+    Answers If-None-Match / If-Modified-Since with 304 Not Modified
+    before anything gets rendered. Only anonymous visitors, the validators
+    don't tell pages rendered for different users apart.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        view = super(ConditionalGetMixin, self).dispatch
+        if not request.user.is_authenticated():
+            view = condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(view)
+        return view(request, *args, **kwargs)
+
+    def get_etag(self, request, *args, **kwargs):
+        return cache.get_list_etag(request, *args, **kwargs)
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return cache.get_list_last_modified(request, *args, **kwargs)
+
+
+class PageCacheMixin(object):
+    """
+    Caches the whole response for anonymous visitors, keyed by language,
+    site and url. Opt-in through ALDRYN_NEWS_PAGE_CACHE. Entries are keyed
+    by the cache timeline and pages versions (see aldryn_news.cache), so they
+    go stale on news, category, tag and plugin changes and at publication
+    boundaries. Goes before ConditionalGetMixin: the validators are cached
+    with the page, so conditional requests are answered from the cache too.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super(PageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        key = cache.make_key('page', cache.get_pages_version(), get_language(), settings.SITE_ID,
+                             request.get_host(), request.get_full_path())
+        cached = cache_backend.get(key)
+        if cached is not None:
+            return self.get_cached_response(request, *cached)
+
+        response = super(PageCacheMixin, self).dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, 'render'):
+                response.render()
+            # pages holding a csrf token or setting cookies are personal
+            if not request.META.get('CSRF_COOKIE_USED') and not response.cookies:
+                # with the validators set by ConditionalGetMixin, hits need no queries at all
+                cached = (response.content, response['Content-Type'],
+                          response.get('ETag'), response.get('Last-Modified'))
+                cache_backend.set(key, cached, cache.get_timeout())
+        return response
 
-class ArchiveView(BaseNewsView, ArchiveIndexView):
+    def get_cached_response(self, request, content, content_type, etag, last_modified):
+        def view(request):
+            return HttpResponse(content, content_type=content_type)
+
+        timestamp = parse_http_date_safe(last_modified) if last_modified else None
+        view = condition(
+            etag_func=lambda request: etag.strip('"') if etag else None,
+            last_modified_func=lambda request: datetime.datetime.utcfromtimestamp(timestamp) if timestamp else None,
+        )(view)
+        return view(request)
+
+    def is_cacheable(self, request):
+        if not PAGE_CACHE or request.method not in ('GET', 'HEAD') or request.user.is_authenticated():
+            return False
+        toolbar = getattr(request, 'toolbar', None)
+        if getattr(toolbar, 'edit_mode', False) or getattr(toolbar, 'show_toolbar', False):
+            return False
+        return get_cms_setting('CMS_TOOLBAR_URL__EDIT_ON') not in request.GET
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginates on (publication_start, id) with an opaque cursor in the query
+    string instead of a page number, see aldryn_news.pagination.
+    """
+    paginate_by = PAGINATE_BY
+    cursor_kwarg = 'after'
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg) or None
+        try:
+            page = paginate(queryset, cursor=cursor, page_size=page_size)
+        except ValueError:
+            raise Http404(_('Invalid page.'))
+        return (None, page, page.object_list, page.has_other_pages())
+
+
+class ArchiveView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, BaseNewsView, ArchiveIndexView):
 
     date_field = 'publication_start'
     allow_empty = True
@@ -35,12 +137,30 @@ class ArchiveView(BaseNewsView, ArchiveIndexView):
 
     def get_queryset(self):
         qs = super(ArchiveView, self).get_queryset()
-        if 'month' in self.kwargs:
-            qs = qs.filter(publication_start__month=self.kwargs['month'])
         if 'year' in self.kwargs:
-            qs = qs.filter(publication_start__year=self.kwargs['year'])
+            # a range instead of __year/__month lookups, so the index on publication_start is used
+            try:
+                start, end = get_date_range(self.kwargs['year'], self.kwargs.get('month'))
+            except ValueError:
+                raise Http404
+            qs = qs.filter(publication_start__gte=start, publication_start__lt=end)
         return qs
 
+    def get_date_list(self, queryset, date_type=None, ordering='ASC'):
+        if self.request.user.is_staff:  # includes unpublished news
+            return super(ArchiveView, self).get_date_list(queryset, date_type, ordering)
+        dates = [month['date'] for month in cache.get_months(get_language())]
+        if 'year' in self.kwargs:
+            dates = [date for date in dates if date.year == int(self.kwargs['year'])]
+        if 'month' in self.kwargs:
+            dates = [date for date in dates if date.month == int(self.kwargs['month'])]
+        if not dates:
+            # counters not filled in or behind, an empty date list would empty the page
+            return super(ArchiveView, self).get_date_list(queryset, date_type, ordering)
+        if (date_type or self.get_date_list_period()) == 'year':
+            dates = sorted(set(date.replace(month=1) for date in dates), reverse=True)
+        return dates if ordering == 'DESC' else dates[::-1]
+
     def get_context_data(self, **kwargs):
         kwargs['month'] = int(self.kwargs.get('month')) if 'month' in self.kwargs else None
         kwargs['year'] = int(self.kwargs.get('year')) if 'year' in self.kwargs else None
@@ -49,17 +169,17 @@ class ArchiveView(BaseNewsView, ArchiveIndexView):
         return super(ArchiveView, self).get_context_data(**kwargs)
 
 
-class TaggedListView(BaseNewsView, ListView):
+class TaggedListView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, BaseNewsView, ListView):
 
     template_name = 'aldryn_news/news_list.html'
 
     def get_queryset(self):
         qs = super(TaggedListView, self).get_queryset()
-        # can't filter by tags (m2m) on TranslatedQuerySet
-        tags = Tag.objects.filter(slug=self.kwargs['tag'])
-        tagged = News.objects.filter(tags__in=tags)
-        tagged_pks = list(tagged.values_list('pk', flat=True))
-        return qs.filter(pk__in=tagged_pks)
+        try:
+            slugs, match_all = parse_tag_slugs(self.kwargs['tag'])
+        except ValueError:
+            raise Http404
+        return qs.tagged(slugs, match_all=match_all)
 
     def get_context_data(self, **kwargs):
         kwargs['tagged_entries'] = (self.kwargs.get('tag')
@@ -67,7 +187,7 @@ class TaggedListView(BaseNewsView, ListView):
         return super(TaggedListView, self).get_context_data(**kwargs)
 
 
-class CategoryListView(BaseNewsView, ListView):
+class CategoryListView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, BaseNewsView, ListView):
 
     template_name = 'aldryn_news/news_list.html'
 
@@ -85,19 +205,37 @@ class CategoryListView(BaseNewsView, ListView):
         return qs.filter(category=self.object)
 
 
-class NewsDetailView(BaseNewsView, DetailView):
+class NewsDetailView(PageCacheMixin, ConditionalGetMixin, BaseNewsView, DetailView):
 
     template_name = 'aldryn_news/news_detail.html'
 
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return self.get_object().get_last_modified()
+
     def get_object(self):
+        if getattr(self, '_news', None):  # already looked up for Last-Modified
+            return self._news
+        # the url holds the date of the (utc) publication_start, see News.get_absolute_url
+        try:
+            start, end = get_date_range(self.kwargs['year'], self.kwargs['month'], self.kwargs['day'],
+                                        tz=timezone.utc)
+        except ValueError:
+            raise Http404
+        qs = self.get_queryset().filter(slug=self.kwargs['slug'],
+                                        publication_start__gte=start,
+                                        publication_start__lt=end)
         # django-hvad 0.3.0 doesn't support Q conditions in `get` method
         # https://github.com/KristianOellegaard/django-hvad/issues/119
-        qs = self.get_queryset()
-        qs = qs.filter(slug=self.kwargs['slug'])
-        if not qs.exists():
+        # slicing instead of exists() + [0] takes a single query
+        try:
+            news = qs[0]
+        except IndexError:
             raise Http404
-        news = qs[0]
         setattr(self.request, request_news_identifier, news)
+        self._news = news
         return news
 
     def get(self, *args, **kwargs):